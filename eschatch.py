@@ -8,6 +8,7 @@ to generate and inject commands into any running terminal application.
 import os
 import pty
 import select
+import selectors
 import sys
 import argparse
 import tty
@@ -15,8 +16,13 @@ import termios
 import fcntl
 import re
 import logging
+import queue
+import threading
+from collections import deque
+from itertools import groupby
+from concurrent.futures import Future
 from pathlib import Path
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Tuple
 
 from config import load_config, get_escape_sequence, create_default_config, DEFAULT_CONFIG
 from context import ContextManager
@@ -32,7 +38,49 @@ logger = logging.getLogger("eschatch")
 
 # ANSI escape patterns
 ANSIESCAPE = r"\033(?:\[[0-9;?]*[a-zA-Z]|][0-9]*;;.*?\\|\\)"
-strip_ansi = lambda x: re.sub(ANSIESCAPE, "", x)
+_ANSI_RE = re.compile(ANSIESCAPE)
+
+
+def strip_ansi(x: str) -> str:
+    """Remove ANSI escape sequences from text."""
+    if "\x1b" not in x:
+        return x
+    return _ANSI_RE.sub("", x)
+
+
+_WS_RE = re.compile(r"(?<=\S)[ \t]+")
+
+
+def _compress(text: str) -> str:
+    """Shrink a screen scrape for the prompt: drop ANSI, squeeze inner spaces and repeated lines."""
+    text = strip_ansi(text).replace("\r\n", "\n")
+    # A bare \r rewrites the line in place; keep only what was drawn last
+    lines = (
+        _WS_RE.sub(" ", line.rstrip("\r").rsplit("\r", 1)[-1]).rstrip()
+        for line in text.split("\n")
+    )
+    return "\n".join(line for line, _ in groupby(lines))
+
+
+# PTY read size; short reads still return as soon as any data is available
+_PTY_BUF = 65536
+
+# Reads per PTY wakeup before going back to the selector, so stdin is still
+# serviced while a child floods its output
+_PTY_DRAIN = 16
+
+
+def _write_all(fd: int, data: bytes) -> None:
+    """Write all of data to fd, retrying short writes and waiting while it is full."""
+    view = memoryview(data)
+    while view:
+        try:
+            n = os.write(fd, view)
+        except BlockingIOError:
+            select.select([], [fd], [])
+            continue
+        view = view[n:]
+
 
 # Destructive command patterns for safety checks
 DESTRUCTIVE_PATTERNS = [
@@ -46,9 +94,106 @@ DESTRUCTIVE_PATTERNS = [
 ]
 
 
+# Constructs that change meaning once a pattern is embedded in an alternation:
+# global inline flags, numbered backreferences and named backreferences
+_NOT_COMBINABLE_RE = re.compile(r"\(\?[aiLmsux]+\)|\\[1-9]|\(\?P=")
+
+
+def _compile_patterns(patterns: List[str]) -> List[re.Pattern]:
+    """Compile patterns case-insensitively, as one alternation when that is equivalent.
+
+    Patterns that cannot be safely combined are compiled one by one instead.
+    """
+    if patterns and not any(_NOT_COMBINABLE_RE.search(p) for p in patterns):
+        try:
+            return [re.compile("|".join(f"(?:{p})" for p in patterns), re.IGNORECASE)]
+        except re.error:
+            pass
+    return [re.compile(p, re.IGNORECASE) for p in patterns]
+
+
+_DEFAULT_DESTRUCTIVE_RES = _compile_patterns(DESTRUCTIVE_PATTERNS)
+
+# Slash commands resolved on the I/O loop as soon as they are submitted. They
+# touch neither the LLM nor conversation history, so they cannot overtake
+# queued work; everything else runs in order on the worker thread.
+_EAGER_SLASH_COMMANDS = frozenset({b"/chat", b"/help"})
+
+DESTRUCTIVE_WARNING = (
+    b"\n\x1b[31m[ESChatch] Warning: Destructive command detected. "
+    b"Press Enter to confirm or Ctrl+C to cancel.\x1b[0m\n"
+)
+
+HELP_TEXT = b"""
+[ESChatch] Special commands:
+  /chat    - Enable multi-turn conversation mode
+  /explain - Explain current terminal state
+  /debug   - Analyze errors and suggest fixes
+  /clear   - Clear conversation history
+  /help    - Show this help message
+"""
+
+# LLM prompt templates, filled in by ESChatch.build_prompt
+_HISTORY_BLOCK = """Previous conversation:
+----
+{history}
+----
+
+"""
+
+_COMMAND_PROMPT = """You are an experienced fullstack software engineer with expertise in all Linux commands and their functionality.
+Given a task, along with a sequence of previous inputs and screen scrape, generate a single line of commands that accomplish the task efficiently.
+This command is to be executed in the current program which can be determined by the screen scrape.
+
+{context}The screen scrape is:
+----
+{recent_output}
+----
+
+The recent input is: {recent_input}
+----
+
+Take special care and look at the most recent part of the screen scrape. Pay attention to:
+- Things like the prompt style, welcome banners
+- Be sensitive if the person is say at a python prompt, ruby prompt, gdb, or perhaps inside a program such as vim
+
+Create a command to accomplish the following task: {query}
+
+If there is text enclosed in parenthesis, that's what ought to be changed.
+
+Output only the command as a single line of plain text, with no quotes, formatting, or additional commentary.
+Do not use markdown or any other formatting. Do not include the command into a code block.
+Don't include the program itself (bash, zsh, etc.) in the command."""
+
+
 class ESChatch:
     """Main ESChatch application."""
 
+    __slots__ = (
+        "config",
+        "exec_command",
+        "escape_key",
+        "context",
+        "llm",
+        "safety",
+        "preview_mode",
+        "confirm_destructive",
+        "destructive_patterns",
+        "_destructive_res",
+        "is_escaped",
+        "chat_mode",
+        "query_buffer",
+        "ansi_save_pos",
+        "ansi_restore_pos",
+        "conversation_history",
+        "_llm_queue",
+        "_pending",
+        "_wake_w",
+        "_wake_lock",
+        "_slash",
+        "system_prompt",
+    )
+
     def __init__(self, config: Dict[str, Any], exec_command: str):
         self.config = config
         self.exec_command = exec_command
@@ -73,90 +218,105 @@ class ESChatch:
             "destructive_patterns",
             DESTRUCTIVE_PATTERNS
         )
+        if self.destructive_patterns is DESTRUCTIVE_PATTERNS:
+            self._destructive_res = _DEFAULT_DESTRUCTIVE_RES
+        else:
+            self._destructive_res = _compile_patterns(self.destructive_patterns)
 
         # State
         self.is_escaped = False
         self.chat_mode = False
-        self.query_buffer = b""
+        self.query_buffer = bytearray()
         self.ansi_save_pos = "\x1b[s"
         self.ansi_restore_pos = "\x1b[u"
-        self.conversation_history = []
+        history_turns = config["context"].get("history_turns", 16)
+        self.conversation_history = deque(maxlen=history_turns * 2)
+
+        # LLM requests run off the I/O loop; one worker keeps them in order.
+        # _wake_w is the self-pipe the worker pokes, None once run() closes it.
+        self._llm_queue = queue.Queue()
+        self._pending = deque()
+        self._wake_w = None
+        self._wake_lock = threading.Lock()
+
+        # Slash command dispatch
+        self._slash = {
+            "/chat": self._cmd_chat,
+            "/explain": self._cmd_explain,
+            "/debug": self._cmd_debug,
+            "/clear": self._cmd_clear,
+            "/help": self._cmd_help,
+        }
 
         # Prompts
         self.system_prompt = config["prompt"].get("system", DEFAULT_CONFIG["prompt"]["system"])
 
-    def build_prompt(self, query: str, chat_mode: bool = False) -> str:
-        """Build the LLM prompt with context."""
-        recent_input, recent_output = self.context.get_context()
+    def build_prompt(
+        self, query: str, chat_mode: bool = False, recent: Optional[Tuple[str, str]] = None
+    ) -> str:
+        """Build the LLM prompt with context.
+
+        recent is a (recent_input, recent_output) snapshot; it is read from the
+        context manager when not given.
+        """
+        if recent is None:
+            recent = self.context.get_context()
+        recent_input, recent_output = recent
 
         if chat_mode and self.conversation_history:
             # In chat mode, include conversation history
-            history = "\n".join([f"{h['role']}: {h['content']}" for h in self.conversation_history[-4:]])
-            context = f"""Previous conversation:
-----
-{history}
-----
-
-"""
+            history = "\n".join([f"{h['role']}: {h['content']}" for h in list(self.conversation_history)[-4:]])
+            context = _HISTORY_BLOCK.format(history=history)
         else:
             context = ""
 
-        return f"""You are an experienced fullstack software engineer with expertise in all Linux commands and their functionality.
-Given a task, along with a sequence of previous inputs and screen scrape, generate a single line of commands that accomplish the task efficiently.
-This command is to be executed in the current program which can be determined by the screen scrape.
-
-{context}The screen scrape is:
-----
-{recent_output}
-----
-
-The recent input is: {recent_input}
-----
-
-Take special care and look at the most recent part of the screen scrape. Pay attention to:
-- Things like the prompt style, welcome banners
-- Be sensitive if the person is say at a python prompt, ruby prompt, gdb, or perhaps inside a program such as vim
-
-Create a command to accomplish the following task: {query}
-
-If there is text enclosed in parenthesis, that's what ought to be changed.
-
-Output only the command as a single line of plain text, with no quotes, formatting, or additional commentary.
-Do not use markdown or any other formatting. Do not include the command into a code block.
-Don't include the program itself (bash, zsh, etc.) in the command."""
+        return _COMMAND_PROMPT.format(
+            context=context,
+            recent_output=_compress(recent_output),
+            recent_input=recent_input,
+            query=query,
+        )
 
     def is_destructive(self, command: str) -> bool:
         """Check if a command appears to be destructive."""
         if not self.confirm_destructive:
             return False
 
-        for pattern in self.destructive_patterns:
-            if re.search(pattern, command, re.IGNORECASE):
-                return True
-        return False
+        return any(r.search(command) for r in self._destructive_res)
 
-    def activate(self, query: bytes, chat_mode: bool = False) -> bytes:
+    def activate(
+        self, query: bytes, chat_mode: bool = False, recent: Optional[Tuple[str, str]] = None
+    ) -> Tuple[bytes, bool]:
         """
         Activate LLM to generate command based on query.
 
         Args:
             query: The user's query as bytes
             chat_mode: Whether to include conversation history
+            recent: (recent_input, recent_output) snapshot taken when the query
+                was submitted; read from the context manager when not given
 
         Returns:
-            Generated command as bytes
+            Generated command as bytes, and whether the destructive-command
+            warning should be shown before it is injected
         """
+        if not query.strip():
+            return b"", False
+
         query_str = query.decode("utf-8", errors="replace").strip()
 
         if not query_str:
-            return b""
+            return b"", False
+
+        if recent is None:
+            recent = self.context.get_context()
 
         # Handle special commands in chat mode
         if query_str.startswith("/"):
-            return self._handle_special_command(query_str)
+            return self._handle_special_command(query_str, recent), False
 
         # Build prompt with context
-        prompt = self.build_prompt(query_str, chat_mode)
+        prompt = self.build_prompt(query_str, chat_mode, recent)
 
         # Generate response
         response = self.llm.generate(
@@ -169,57 +329,97 @@ Don't include the program itself (bash, zsh, etc.) in the command."""
             self.conversation_history.append({"role": "user", "content": query_str})
             self.conversation_history.append({"role": "assistant", "content": response})
 
-        # Safety check for destructive commands
+        # Safety check for destructive commands; in preview mode the caller
+        # shows the warning
+        warn = False
         if self.is_destructive(response):
-            logger.warning(f"Potentially destructive command detected: {response}")
-            if self.preview_mode:
-                # In preview mode, show warning and don't auto-inject
-                sys.stdout.write(
-                    f"\n\x1b[31m[ESChatch] Warning: Destructive command detected. Press Enter to confirm or Ctrl+C to cancel.\x1b[0m\n"
-                )
-                sys.stdout.flush()
-
-        logger.info(f"LLM response: {response}")
-        return response.encode("utf-8") + b"\n"
-
-    def _handle_special_command(self, cmd: str) -> bytes:
+            logger.warning("Potentially destructive command detected: %s", response)
+            warn = self.preview_mode
+
+        logger.info("LLM response: %s", response)
+        return response.encode("utf-8") + b"\n", warn
+
+    def _handle_special_command(self, cmd: str, recent: Tuple[str, str]) -> bytes:
         """Handle special slash commands."""
         cmd = cmd.lower().strip()
+        handler = self._slash.get(cmd)
+        if handler is None:
+            return f"[ESChatch] Unknown command: {cmd}\n".encode()
+        return handler(recent)
 
-        if cmd == "/chat":
-            self.chat_mode = True
-            return b"[ESChatch] Chat mode enabled. Continue the conversation or press Enter twice to exit.\n"
-        elif cmd == "/explain":
-            recent_input, recent_output = self.context.get_context()
-            prompt = f"Explain what is happening in this terminal session:\n----\n{recent_output}\n----\nRecent input: {recent_input}"
-            response = self.llm.generate(
-                messages=[{"role": "user", "content": prompt}],
-                system_prompt="You are a helpful assistant that explains terminal sessions clearly and concisely."
-            )
-            return f"\n{response}\n".encode()
-        elif cmd == "/debug":
-            recent_input, recent_output = self.context.get_context()
-            prompt = f"Analyze the last error or issue in this terminal session and suggest how to fix it:\n----\n{recent_output}\n----\nRecent input: {recent_input}"
-            response = self.llm.generate(
-                messages=[{"role": "user", "content": prompt}],
-                system_prompt="You are an expert debugger that helps identify and fix terminal/command errors."
-            )
-            return f"\n{response}\n".encode()
-        elif cmd == "/clear":
-            self.conversation_history = []
-            return b"[ESChatch] Conversation history cleared.\n"
-        elif cmd == "/help":
-            help_text = """
-[ESChatch] Special commands:
-  /chat    - Enable multi-turn conversation mode
-  /explain - Explain current terminal state
-  /debug   - Analyze errors and suggest fixes
-  /clear   - Clear conversation history
-  /help    - Show this help message
-"""
-            return help_text.encode()
+    def _cmd_chat(self, recent: Tuple[str, str]) -> bytes:
+        """Enable multi-turn conversation mode."""
+        self.chat_mode = True
+        return b"[ESChatch] Chat mode enabled. Continue the conversation or press Enter twice to exit.\n"
+
+    def _cmd_explain(self, recent: Tuple[str, str]) -> bytes:
+        """Explain the current terminal state."""
+        recent_input, recent_output = recent
+        prompt = f"Explain what is happening in this terminal session:\n----\n{recent_output}\n----\nRecent input: {recent_input}"
+        response = self.llm.generate(
+            messages=[{"role": "user", "content": prompt}],
+            system_prompt="You are a helpful assistant that explains terminal sessions clearly and concisely."
+        )
+        return f"\n{response}\n".encode()
+
+    def _cmd_debug(self, recent: Tuple[str, str]) -> bytes:
+        """Analyze the last error and suggest a fix."""
+        recent_input, recent_output = recent
+        prompt = f"Analyze the last error or issue in this terminal session and suggest how to fix it:\n----\n{recent_output}\n----\nRecent input: {recent_input}"
+        response = self.llm.generate(
+            messages=[{"role": "user", "content": prompt}],
+            system_prompt="You are an expert debugger that helps identify and fix terminal/command errors."
+        )
+        return f"\n{response}\n".encode()
+
+    def _cmd_clear(self, recent: Tuple[str, str]) -> bytes:
+        """Clear the conversation history."""
+        self.conversation_history.clear()
+        return b"[ESChatch] Conversation history cleared.\n"
+
+    def _cmd_help(self, recent: Tuple[str, str]) -> bytes:
+        """Show the available slash commands."""
+        return HELP_TEXT
+
+    def _llm_worker(self) -> None:
+        """Run queued activate() calls, resolving each query's future."""
+        while True:
+            fut, query, chat_mode, recent = self._llm_queue.get()
+            if not fut.set_running_or_notify_cancel():
+                continue
+            try:
+                fut.set_result(self.activate(query, chat_mode, recent))
+            except Exception as e:
+                fut.set_exception(e)
+
+    def _submit(self, query: bytes, chat_mode: bool) -> Future:
+        """Queue a query for the LLM worker and return its future.
+
+        /chat and /help are resolved immediately, so the mode change applies
+        to the next query typed; anything touching the LLM or conversation
+        history (including /clear) queues behind pending work. The
+        screen scrape is captured here, as it was when Enter was pressed, so
+        the worker never touches the context manager.
+        """
+        fut = Future()
+        fut.add_done_callback(self._notify)
+        recent = self.context.get_context()
+        cmd = query.strip().lower()
+        if cmd in _EAGER_SLASH_COMMANDS:
+            fut.set_result(self.activate(query, chat_mode, recent))
         else:
-            return f"[ESChatch] Unknown command: {cmd}\n".encode()
+            self._llm_queue.put((fut, query, chat_mode, recent))
+        return fut
+
+    def _notify(self, _fut: Future) -> None:
+        """Wake the I/O loop; a no-op once the self-pipe is closed."""
+        with self._wake_lock:
+            if self._wake_w is None:
+                return
+            try:
+                os.write(self._wake_w, b"\0")
+            except OSError:
+                pass
 
     def show_escape_prompt(self) -> None:
         """Show the escape mode prompt overlay."""
@@ -229,6 +429,14 @@ Don't include the program itself (bash, zsh, etc.) in the command."""
         sys.stdout.write("\x1b[7m[ESChatch] Task: \x1b[0m")
         sys.stdout.flush()
 
+    def enter_escape_mode(self) -> None:
+        """Switch to escape mode and show the matching prompt."""
+        self.is_escaped = True
+        if self.chat_mode:
+            sys.stdout.write("\x1b[7m[ESChatch] (chat) Task: \x1b[0m")
+        else:
+            self.show_escape_prompt()
+
     def restore_after_prompt(self) -> None:
         """Restore cursor position after prompt."""
         sys.stdout.write(self.ansi_restore_pos)
@@ -260,71 +468,140 @@ Don't include the program itself (bash, zsh, etc.) in the command."""
                 # Parent process - handle I/O
                 self.set_pty_size(fd, sys.stdin.fileno())
 
+                # Drain the PTY until it would block, one selector wakeup per burst.
+                # stdin stays blocking: it shares its file description with stdout.
+                os.set_blocking(fd, False)
+
+                # Bind hot-loop lookups to locals
+                _read = os.read
+                _out = sys.stdout.fileno()
+                _stdin_fd = sys.stdin.fileno()
+                _append_in = self.context.append_input
+                _append_out = self.context.append_output
+                _esc = self.escape_key
+
+                # Self-pipe the LLM worker pokes when a command is ready. The
+                # worker is a daemon so exit never waits on an HTTP request.
+                wake_r, self._wake_w = os.pipe()
+                os.set_blocking(wake_r, False)
+                threading.Thread(target=self._llm_worker, daemon=True).start()
+
+                # Register fds once; epoll/kqueue only report ready ones
+                sel = selectors.DefaultSelector()
+                sel.register(fd, selectors.EVENT_READ)
+                sel.register(_stdin_fd, selectors.EVENT_READ)
+                sel.register(wake_r, selectors.EVENT_READ)
+
+                # Whether PTY output arrived since the last query was submitted
+                output_seen = False
+
                 while True:
-                    r, _, _ = select.select([fd, sys.stdin], [], [])
+                    r = {key.fd for key, _ in sel.select()}
 
-                    if sys.stdin in r:
-                        user_input = os.read(sys.stdin.fileno(), 1024)
+                    if _stdin_fd in r:
+                        user_input = _read(_stdin_fd, _PTY_BUF)
                         if not user_input:
                             break
 
+                        # Check for escape key; bytes typed before it still go to the PTY
+                        if not self.is_escaped:
+                            idx = user_input.find(_esc)
+                            if idx >= 0:
+                                if idx:
+                                    _append_in(user_input[:idx])
+                                    _write_all(fd, user_input[:idx])
+                                self.enter_escape_mode()
+                                user_input = user_input[idx + len(_esc):]
+                                if not user_input:
+                                    continue
+
                         # Handle escape mode
                         if self.is_escaped:
-                            self.query_buffer += user_input
+                            self.query_buffer.extend(user_input)
 
                             # Check for Enter/Return to submit
                             if b"\r" in user_input or b"\n" in user_input:
                                 # Check for double-enter to exit chat mode
-                                query_text = self.query_buffer.decode("utf-8", errors="replace").strip()
-                                if self.chat_mode and not query_text:
+                                if self.chat_mode and not self.query_buffer.strip():
                                     self.is_escaped = False
                                     self.chat_mode = False
                                     sys.stdout.write("\x1b[2K\r")
                                     sys.stdout.write("\x1b[32m[ESChatch] Chat mode exited.\x1b[0m\n")
                                     sys.stdout.flush()
-                                    self.query_buffer = b""
+                                    self.query_buffer.clear()
                                     continue
 
                                 self.is_escaped = False
 
                                 # Clear the prompt line
                                 sys.stdout.write("\x1b[2K\r")
+                                sys.stdout.flush()
 
-                                # Generate command (pass chat_mode flag)
-                                command = self.activate(self.query_buffer, self.chat_mode)
+                                # Generate command in the background (pass chat_mode flag)
+                                self._pending.append(
+                                    self._submit(bytes(self.query_buffer), self.chat_mode)
+                                )
+                                output_seen = False
 
-                                # Restore and inject
-                                self.restore_after_prompt()
-                                os.write(fd, command)
-
-                                self.query_buffer = b""
+                                self.query_buffer.clear()
                                 continue
 
-                        # Check for escape key
-                        if self.escape_key in user_input:
-                            self.is_escaped = True
-                            if self.chat_mode:
-                                sys.stdout.write("\x1b[7m[ESChatch] (chat) Task: \x1b[0m")
-                            else:
-                                self.show_escape_prompt()
-                            continue
+                            # Escape key pressed again while already escaped
+                            if _esc in user_input:
+                                self.enter_escape_mode()
+                                continue
 
                         # Log input
-                        self.context.append_input(user_input)
+                        _append_in(user_input)
 
                         # Forward to PTY
-                        os.write(fd, user_input)
+                        _write_all(fd, user_input)
 
                     if fd in r:
-                        output = os.read(fd, 1024)
-                        if not output:
+                        eof = False
+                        for _ in range(_PTY_DRAIN):
+                            try:
+                                output = _read(fd, _PTY_BUF)
+                            except BlockingIOError:
+                                break
+                            if not output:
+                                eof = True
+                                break
+
+                            # Log output. Every byte has to reach the context buffer
+                            # for the screen scrape, so a kernel-side splice to stdout
+                            # would still need a userspace read here.
+                            _append_out(output)
+
+                            # Forward to terminal
+                            _write_all(_out, output)
+                            output_seen = True
+
+                        if eof:
                             break
 
-                        # Log output
-                        self.context.append_output(output)
+                    if wake_r in r:
+                        try:
+                            _read(wake_r, 4096)
+                        except BlockingIOError:
+                            pass
+
+                        # Inject finished commands in submission order. The saved
+                        # cursor is stale once output has moved the screen.
+                        while self._pending and self._pending[0].done():
+                            command, warn = self._pending.popleft().result()
+                            if warn:
+                                # In preview mode, show warning before injecting
+                                _write_all(_out, DESTRUCTIVE_WARNING)
+                            if not output_seen:
+                                self.restore_after_prompt()
+                            _write_all(fd, command)
 
-                        # Forward to terminal
-                        os.write(sys.stdout.fileno(), output)
+                sel.close()
+                with self._wake_lock:
+                    os.close(self._wake_w)
+                    self._wake_w = None
+                os.close(wake_r)
 
         except (OSError, KeyboardInterrupt):
             logger.info("Exiting...")
@@ -412,9 +689,10 @@ Escape mode:
         config["safety"]["preview_mode"] = True
 
     # Print info
-    logger.info(f"Starting ESChatch with command: {args.exec_command}")
-    logger.info(f"Escape key: {config['general'].get('escape_key', 'ctrl+x')}")
-    logger.info(f"Model: {config['llm'].get('model', 'gpt-4o-mini')}")
+    logger.info("Starting ESChatch with command: %s", args.exec_command)
+    if logger.isEnabledFor(logging.INFO):
+        logger.info("Escape key: %s", config["general"].get("escape_key", "ctrl+x"))
+        logger.info("Model: %s", config["llm"].get("model", "gpt-4o-mini"))
 
     # Run
     app = ESChatch(config, args.exec_command)